@@ -8,19 +8,19 @@ def format_dict_str(d, name, label2="Synonyms"):
         arr_l += [len(s) for s in syns]
 
     ll = max(arr_l)
+    bar = ll * "="
+    pad = ll * " "
 
-    tab = """{} ========\n{:<{}} {}\n{} ========\n""".format(
-        ll * "=", name, ll, label2, ll * "="
-    )
+    parts = [f"{bar} ========", f"{name:<{ll}} {label2}", f"{bar} ========"]
 
     for k, syns in sorted(d.items(), key=lambda i: i[0]):
-        tab += "{:<{}} {}\n".format(k, ll, syns[0] if len(syns) > 0 else "")
+        parts.append(f"{k:<{ll}} {syns[0] if len(syns) > 0 else ''}")
         if len(syns) > 1:
             for s in syns[1:]:
-                tab += "\n{} {}\n".format(ll * " ", s)
+                parts.append(f"\n{pad} {s}")
 
-    tab += "{} ========".format(ll * "=")
-    return tab.strip()
+    parts.append(f"{bar} ========")
+    return "\n".join(parts).strip()
 
 
 def format_dict_enum(d, name):
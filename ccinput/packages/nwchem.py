@@ -21,32 +21,89 @@ from ccinput.exceptions import (
     MissingParameter,
 )
 
+_WHITELIST = frozenset(
+    "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ/()=-,._ "
+)
+_DELETE_TABLE = str.maketrans(
+    "", "", "".join(chr(c) for c in range(256) if chr(c) not in _WHITELIST)
+)
+
+_RE_ECP = re.compile(r"ECP\n(.*?)END", re.DOTALL)
+_RE_BASIS = re.compile(r'BASIS "ao basis" SPHERICAL PRINT\n(.*?)END', re.DOTALL)
+_RE_SPEC = re.compile(r".*\((.*)\)")
+
+_METHOD_BLOCKS = frozenset(("scf", "dft", "hf"))
+_OPT_BLOCKS = frozenset(("opt", "ts"))
+_MEP_BLOCKS = frozenset(("neb", "string", "fsm", "mep"))
+_SOL_BLOCKS = frozenset(("sol", "cosmo", "smd"))
+_MCSCF_BLOCKS = frozenset(("mcscf", "casscf"))
+_FSM_SPECS = frozenset(("string", "freezing string sethod", "fsm", "freezing string"))
+_OPT_TYPES = frozenset(
+    (CalcType.CONSTR_OPT, CalcType.OPT, CalcType.TS, CalcType.OPTFREQ)
+)
+_CC_LEVELS = frozenset(("mp2", "ccsd"))
+_SMD_MODELS = frozenset(("smd", "smd18"))
+_VACUUM = frozenset(("", "vacuum"))
+_DEFAULT_RADII = frozenset(("", "default"))
+
+
+def _split_basis_chunks(body):
+    """Split a multi-element "ao basis" block from the basis set exchange into
+    per-element chunks, as individual requests would have returned them.
+    The exchange writes one '#BASIS SET:' comment per element."""
+    chunks = {}
+    el = None
+    lines = []
+    for line in body.splitlines(keepends=True):
+        if line.startswith("#BASIS SET"):
+            if el is not None:
+                chunks[el] = "".join(lines)
+            el = None
+            lines = []
+        elif el is None and line.strip() != "":
+            el = line.split()[0]
+        lines.append(line)
+    if el is not None:
+        chunks[el] = "".join(lines)
+    return chunks
+
+
+def _split_ecp_chunks(body):
+    """Split a multi-element ECP block from the basis set exchange into
+    per-element chunks; each element's section starts with '<El> nelec <n>'."""
+    chunks = {}
+    el = None
+    lines = []
+    for line in body.splitlines(keepends=True):
+        tokens = line.split()
+        if len(tokens) >= 2 and tokens[1] == "nelec":
+            if el is not None:
+                chunks[el] = "".join(lines)
+            el = tokens[0]
+            lines = []
+        lines.append(line)
+    if el is not None:
+        chunks[el] = "".join(lines)
+    return chunks
 
-class NWChemCalculation:
-    TEMPLATE = """TITLE "{}"
-    start {}
-    memory total {}
-    charge {}
+
+def _render(header, name, mem, charge, xyz, basis, method, calc_block, addl, tasks):
+    return f"""TITLE "{header}"
+    start {name}
+    memory total {mem}
+    charge {charge}
 
     geometry units angstroms noautosym
-    {}end
+    {xyz}end
 
-    {}
+    {basis}
 
-    {}{}{}
-    {}
+    {method}{calc_block}{addl}
+    {tasks}
     """
-    # Header
-    # Name
-    # Amount of memory
-    # Charge
-    # Geometry
-    # Basis set
-    # Method Block
-    # Calculation Block
-    # Additional Block
-    # Tasks
 
+
+class NWChemCalculation:
     KEYWORDS = {
         CalcType.OPT: ["optimize"],
         CalcType.CONSTR_OPT: ["optimize"],
@@ -62,15 +119,19 @@ class NWChemCalculation:
         self.calc = calc
         self.calc.mem = f"{int(self.calc.mem/self.calc.nproc)} mb"
         self.has_scan = False
+        self._has_string_task = False
+        self._addl_closed = False
         self.appendix = []
         self.command_line = ""
-        self.method_block = ""
-        self.calculation_block = ""
-        self.additional_block = ""
+        # The blocks are accumulated as lists of fragments and joined once
+        # into strings by close_blocks()
+        self.method_block = []
+        self.calculation_block = []
+        self.additional_block = []
         self.commands = {}
         self.solvation_radii = {}
         self.xyz_structure = ""
-        self.tasks = ""
+        self.tasks = []
         self.radii_parameters = ""
         self.input_file = ""
         # Some specific syntax processing related only to nwchem
@@ -83,7 +144,7 @@ class NWChemCalculation:
         elif self.calc.parameters.theory_level == "cc":
             # Name of any coupled cluster block is ccsd
             self.calc.parameters.theory_level = "ccsd"
-        self.method_block = f"{self.calc.parameters.theory_level}"
+        self.method_block = [self.calc.parameters.theory_level]
 
         if self.calc.type not in self.KEYWORDS:
             raise ImpossibleCalculation(
@@ -98,10 +159,10 @@ class NWChemCalculation:
         self.create_input_file()
 
     def clean(self, s):
-        WHITELIST = set(
-            "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ/()=-,._ "
-        )
-        return "".join([c for c in s if c in WHITELIST])
+        if s.isascii():
+            # Runs in C; the table deletes every ASCII character outside the whitelist
+            return s.translate(_DELETE_TABLE)
+        return "".join([c for c in s if c in _WHITELIST])
 
     def separate_lines(self, text):
         text = text.replace(")", ");")
@@ -115,35 +176,35 @@ class NWChemCalculation:
     def handle_tasks(self):
         for word in self.KEYWORDS[self.calc.type]:
             # different cc methods are distinguished in tasks section
-            if self.calc.parameters.theory_level in ["ccsd", "mp2"]:
+            if self.calc.parameters.theory_level in _CC_LEVELS:
                 keyword = self.calc.parameters.method
             else:
                 keyword = self.calc.parameters.theory_level
-            self.tasks += f"task {keyword} {word} \n"
+            self.tasks.append(f"task {keyword} {word} \n")
         # handle levels of theory
         if self.calc.parameters.theory_level == "scf":
             scf_block = "\n"
             if self.calc.parameters.method != "hf":
                 scf_block += f"{self.calc.parameters.method} \n"
             scf_block += f"{SOFTWARE_MULTIPLICITY['nwchem'][self.calc.multiplicity]} \n"
-            self.method_block += scf_block
+            self.method_block.append(scf_block)
         elif self.calc.parameters.theory_level == "dft":
             dft_block = f"""
             xc {self.calc.parameters.method}
             mult {self.calc.multiplicity}
             """
-            self.method_block += dft_block
+            self.method_block.append(dft_block)
             # dispersion
             if self.calc.parameters.d3:
-                self.method_block += "disp vdw 3 \n"
+                self.method_block.append("disp vdw 3 \n")
             elif self.calc.parameters.d3bj:
-                self.method_block += "disp vdw 4 \n"
+                self.method_block.append("disp vdw 4 \n")
         elif self.calc.parameters.theory_level == "mcscf":
-            self.method_block += f" \n multiplicity {self.calc.multiplicity} \n"
-        elif self.calc.parameters.theory_level in ["mp2", "ccsd"]:
-            self.method_block += "\n"
+            self.method_block.append(f" \n multiplicity {self.calc.multiplicity} \n")
+        elif self.calc.parameters.theory_level in _CC_LEVELS:
+            self.method_block.append("\n")
         if self.calc.type == CalcType.NMR:
-            self.calculation_block += f" \n property \n shielding \n"
+            self.calculation_block.append(" \n property \n shielding \n")
         if (
             self.calc.parameters.method == "rimp2"
             and self.calc.parameters.density_fitting == ""
@@ -171,21 +232,17 @@ class NWChemCalculation:
 
     def parse_custom_basis_set(self, base_bs):
         custom_basis_sets = self.calc.parameters.custom_basis_sets
-        to_append_bs = []
-        to_append_ecp = []
         not_recoginzed_bs = {}
-        unique_atoms = []
+        unique_atoms = set()
         normal_atoms = []
-        for line in self.calc.xyz.split("\n"):
-            if line.strip() == "":
-                continue
-            a, *_ = line.split()
+        for a in self._atoms:
             if a not in unique_atoms:
-                unique_atoms.append(a)
-                if a not in normal_atoms and a not in custom_basis_sets:
+                unique_atoms.add(a)
+                if a not in custom_basis_sets:
                     normal_atoms.append(a)
 
         custom_atoms = []
+        by_keyword = {}
         for el, bs_keyword in custom_basis_sets.items():
             if el not in unique_atoms:
                 continue
@@ -197,34 +254,60 @@ class NWChemCalculation:
                 raise InvalidParameter(
                     f"Invalid atom in custom basis set string: '{el}'"
                 )
+            by_keyword.setdefault(bs_keyword, []).append((el, el_num))
 
+        bs_chunks = {}
+        ecp_chunks = {}
+        for bs_keyword, elements in by_keyword.items():
             try:
+                # One request per keyword: the exchange parses large catalogs,
+                # so elements sharing a basis set are fetched together
                 bs = basis_set_exchange.get_basis(
                     bs_keyword,
                     fmt="nwchem",
-                    elements=[el_num],
+                    elements=[el_num for el, el_num in elements],
                     header=False,
                     optimize_general=True,
                     uncontract_general=True,
                 )
-
             except:
-                # Some basis sets are built-in, but use different names as the BSE does (e.g., SDD)
-                # In this case, just feed the user keyword in and hope it works.
-                # The basis set string has been recognized by ccinput, so it should exist in the program.
-                # ECP is NOT added in this case, and the user will recieve a warning
-                warn(
-                    f"Basis set {bs_keyword} couldn't be pulled from basis set exchange. The ECP will not be added to this basis set."
-                )
-                not_recoginzed_bs[el] = bs_keyword
+                # The batch can fail because of a single element; retry one by
+                # one to find out which ones the BSE actually recognizes.
+                for el, el_num in elements:
+                    try:
+                        bs = basis_set_exchange.get_basis(
+                            bs_keyword,
+                            fmt="nwchem",
+                            elements=[el_num],
+                            header=False,
+                            optimize_general=True,
+                            uncontract_general=True,
+                        )
+                    except:
+                        # Some basis sets are built-in, but use different names as the BSE does (e.g., SDD)
+                        # In this case, just feed the user keyword in and hope it works.
+                        # The basis set string has been recognized by ccinput, so it should exist in the program.
+                        # ECP is NOT added in this case, and the user will recieve a warning
+                        warn(
+                            f"Basis set {bs_keyword} couldn't be pulled from basis set exchange. The ECP will not be added to this basis set."
+                        )
+                        not_recoginzed_bs[el] = bs_keyword
+                    else:
+                        matched_ECP = _RE_ECP.search(bs)
+                        matched_bs = _RE_BASIS.search(bs)
+                        if matched_ECP != None:
+                            ecp_chunks[el] = matched_ECP.group(1)
+                        bs_chunks[el] = matched_bs.group(1)
             else:
-                matched_ECP = re.search(r"ECP\n(.*?)END", bs, re.DOTALL)
-                matched_bs = re.search(
-                    r'BASIS "ao basis" SPHERICAL PRINT\n(.*?)END', bs, re.DOTALL
-                )
+                matched_ECP = _RE_ECP.search(bs)
+                matched_bs = _RE_BASIS.search(bs)
                 if matched_ECP != None:
-                    to_append_ecp.append(matched_ECP.group(1))
-                to_append_bs.append(matched_bs.group(1))
+                    ecp_chunks.update(_split_ecp_chunks(matched_ECP.group(1)))
+                bs_chunks.update(_split_basis_chunks(matched_bs.group(1)))
+
+        # Assemble the blocks in the order the custom basis sets were given
+        to_append_bs = [bs_chunks[el] for el in custom_atoms if el in bs_chunks]
+        to_append_ecp = [ecp_chunks[el] for el in custom_atoms if el in ecp_chunks]
         if len(custom_atoms) > 0:
             custom_bs = "\n".join(to_append_bs)
             self.basis_set = f"basis spherical \n {custom_bs} \n "
@@ -235,8 +318,10 @@ class NWChemCalculation:
         if len(not_recoginzed_bs) > 0:
             if self.basis_set == None:
                 self.basis_set = "basis\n"
-            for element in not_recoginzed_bs:
-                self.basis_set += f"{element} library {not_recoginzed_bs[element]} \n"
+            self.basis_set += "".join(
+                f"{element} library {bs_keyword} \n"
+                for element, bs_keyword in not_recoginzed_bs.items()
+            )
         try:
             self.basis_set += "end"
         except:
@@ -247,9 +332,12 @@ class NWChemCalculation:
             self.basis_set += " end"
 
     def handle_specifications(self):
-        if self.clean(self.calc.parameters.specifications).strip() != "":
+        spec_raw = self.calc.parameters.specifications
+        # The strip() alone rules out the common empty/default case without
+        # running clean() on the whole string
+        if spec_raw.strip() != "" and self.clean(spec_raw).strip() != "":
             temp = "\n"  # Here we will store frequency related specifiations in case of FREQOPT calculations
-            s = self.separate_lines(self.calc.parameters.specifications)
+            s = self.separate_lines(spec_raw)
             # Could be more sophisticated to catch other incorrect specifications
             if s.count("(") != s.count(")"):
                 raise InvalidParameter(
@@ -257,25 +345,23 @@ class NWChemCalculation:
                 )
             for spec in s.split("\n"):
                 # format of the specifications is BLOCK_NAME1(command1);BLOCK_NAME2(command2);...
-                matched = re.search(r".*\((.*)\)", spec)
+                matched = _RE_SPEC.search(spec)
                 if matched == None:
                     # To make a difference between neb(defualt mep method) and freezing string method
                     # User has to put some of the following keyword as specification, independant of what calculation was specified in input
-                    if spec in [
-                        "string",
-                        "freezing string sethod",
-                        "fsm",
-                        "freezing string",
-                    ]:
-                        self.tasks = self.tasks.replace("neb", "string")
+                    if spec in _FSM_SPECS:
+                        self.tasks = [
+                            task.replace("neb", "string") for task in self.tasks
+                        ]
+                        self._has_string_task = True
                     else:
-                        self.additional_block += f"{spec} \n"
+                        self.additional_block.append(f"{spec} \n")
                 else:
                     command = matched.group(1)
                     if command.find(",") != -1:
                         command = command.replace(",", "\n").strip()
                     block_name = spec[: matched.span(1)[0] - 1]
-                    if block_name == "scf" or block_name == "dft" or block_name == "hf":
+                    if block_name in _METHOD_BLOCKS:
                         if (
                             command == "adft"
                             and self.calc.parameters.density_fitting == ""
@@ -283,65 +369,51 @@ class NWChemCalculation:
                             raise InvalidParameter(
                                 "adft keyword requires auxilary basis set"
                             )
-                        self.method_block += f"{command} \n"
-                    elif (block_name == "opt" or block_name == "ts") and (
-                        self.calc.type
-                        in [
-                            CalcType.CONSTR_OPT,
-                            CalcType.OPT,
-                            CalcType.TS,
-                            CalcType.OPTFREQ,
-                        ]
-                    ):
-                        if self.calculation_block == "":
-                            self.calculation_block += f"\n driver \n"
-                        self.calculation_block += f"{command} \n"
+                        self.method_block.append(f"{command} \n")
+                    elif block_name in _OPT_BLOCKS and self.calc.type in _OPT_TYPES:
+                        if not self.calculation_block:
+                            self.calculation_block.append("\n driver \n")
+                        self.calculation_block.append(f"{command} \n")
                     elif block_name == "nmr" and self.calc.type == CalcType.NMR:
-                        self.calculation_block += f"{command} \n"
+                        self.calculation_block.append(f"{command} \n")
                     elif block_name == "freq" and self.calc.type == CalcType.FREQ:
-                        if self.calculation_block == "":
-                            self.calculation_block += f"\n freq \n"
-                        self.calculation_block += f"{command} \n"
+                        if not self.calculation_block:
+                            self.calculation_block.append("\n freq \n")
+                        self.calculation_block.append(f"{command} \n")
                     elif block_name == "freq" and self.calc.type == CalcType.OPTFREQ:
                         temp += f"{command} \n"
-                    elif (
-                        block_name in ["neb", "string", "fsm", "mep"]
-                        and self.calc.type == CalcType.MEP
-                    ):
-                        if self.calculation_block == "":
-                            self.calculation_block += f"\n neb \n"
-                        self.calculation_block += f"{command} \n"
-                    elif (
-                        block_name == "sol"
-                        or block_name == "cosmo"
-                        or block_name == "smd"
-                    ):
-                        self.additional_block = self.additional_block.replace(
-                            "cosmo \n", f"cosmo \n {command} \n"
-                        )
+                    elif block_name in _MEP_BLOCKS and self.calc.type == CalcType.MEP:
+                        if not self.calculation_block:
+                            self.calculation_block.append("\n neb \n")
+                        self.calculation_block.append(f"{command} \n")
+                    elif block_name in _SOL_BLOCKS:
+                        self.additional_block = [
+                            part.replace("cosmo \n", f"cosmo \n {command} \n")
+                            for part in self.additional_block
+                        ]
                     elif (
                         block_name == "mp2"
                         and self.calc.parameters.theory_level == "mp2"
                     ):
-                        self.method_block += f"{command} \n"
+                        self.method_block.append(f"{command} \n")
                     elif (
                         block_name == "cc"
                         and self.calc.parameters.theory_level == "ccsd"
                     ):
-                        self.method_block += f"{command} \n"
-                    elif (
-                        block_name in ["mcscf", "casscf"]
-                        and self.calc.type == CalcType.SP
-                    ):
-                        self.method_block += f"{command} \n"
+                        self.method_block.append(f"{command} \n")
+                    elif block_name in _MCSCF_BLOCKS and self.calc.type == CalcType.SP:
+                        self.method_block.append(f"{command} \n")
             if temp != "\n":
-                self.additional_block += f"\n freq {temp} end \n"
-        if self.tasks.find("string") != -1:
-            self.calculation_block = self.calculation_block.replace("neb", "string")
+                self.additional_block.append(f"\n freq {temp} end \n")
+                self._addl_closed = True
+        if self._has_string_task:
+            self.calculation_block = [
+                part.replace("neb", "string") for part in self.calculation_block
+            ]
         # Check if there are necessary specifications for mcscf calculation:
         if (
-            self.method_block.find("active") == -1
-            or self.method_block.find("actelec") == -1
+            not any("active" in part for part in self.method_block)
+            or not any("actelec" in part for part in self.method_block)
         ) and self.calc.parameters.theory_level == "mcscf":
             raise MissingParameter(
                 "You must specify the number of active orbitals and active electrons in CASSCF calculation"
@@ -349,52 +421,54 @@ class NWChemCalculation:
         # Check if there is density fitting for DFT but adft keyword is not specified
         if (
             self.calc.parameters.theory_level == "dft"
-            and self.method_block.find("adft") == -1
+            and not any("adft" in part for part in self.method_block)
             and self.calc.parameters.density_fitting != ""
         ):
-            self.method_block += f"adft \n"
-        # Handle contraints
+            self.method_block.append("adft \n")
+        # Handle contraints and scans (TO_DO)
         if self.calc.type == CalcType.CONSTR_OPT:
             if len(self.calc.constraints) == 0:
                 raise InvalidParameter("No constraint in constrained optimisation mode")
-            constraints = ""
+            zcoord_parts = []
+            scan_parts = []
             for constraint in self.calc.constraints:
-                constraints += constraint.to_nwchem()
+                constraint_str = constraint.to_nwchem()
+                zcoord_parts.append(constraint_str)
+                if constraint.scan:
+                    scan_parts.append(constraint_str)
+            constraints = "".join(zcoord_parts)
             if constraints != "":
-                self.additional_block += (
+                self.additional_block.append(
                     f"\n geometry adjust \n zcoord \n {constraints} end \n end \n"
                 )
-
-        # Handle scans (TO_DO)
-        if self.calc.type == CalcType.CONSTR_OPT:
-            for constraint in self.calc.constraints:
-                if constraint.scan:
-                    self.additional_block += constraint.to_nwchem()
+                self._addl_closed = True
+            self.additional_block.extend(scan_parts)
 
     def handle_xyz(self):
         lines = [i + "\n" for i in clean_xyz(self.calc.xyz).split("\n") if i != ""]
         self.xyz_structure = "".join(lines)
+        self._atoms = [line.split(None, 1)[0] for line in lines if line.strip()]
 
     def handle_solvation(self):
         """Default radii used in nwchem are complex combination of different sources.
         More info can be found: https://nwchemgit.github.io/Solvation-Models
         """
-        if self.calc.parameters.solvent.lower() not in ["", "vacuum"]:
+        if self.calc.parameters.solvent.lower() not in _VACUUM:
             solvation_model = self.calc.parameters.solvation_model.lower()
             solvent_keyword = get_solvent(
                 self.calc.parameters.solvent,
                 self.calc.parameters.software,
                 solvation_model=self.calc.parameters.solvation_model,
             )
-            self.additional_block += (
+            self.additional_block.append(
                 f"\n cosmo \n minbem 3 \n ificos 1 \n solvent {solvent_keyword} \n"
             )
             """ Best grids recommended by Marenich, A. V.; Cramer, C. J.; Truhlar, D. G.
             The Journal of Physical Chemistry B 2009, 113 (18), 6378-6396. https://doi.org/10.1021/jp810292n."""
-            if solvation_model in ["cosmo"]:
+            if solvation_model == "cosmo":
                 pass
-            elif solvation_model in ["smd", "smd18"]:
-                self.additional_block += "do_cosmo_smd \n"
+            elif solvation_model in _SMD_MODELS:
+                self.additional_block.append("do_cosmo_smd \n")
                 if self.calc.parameters.theory_level != "dft":
                     raise UnimplementedError(
                         "SMD model is only available with DFT in nwchem."
@@ -403,7 +477,7 @@ class NWChemCalculation:
                 raise UnimplementedError(
                     f"Solvation model {solvation_model} is not implemented in nwchem."
                 )
-            if self.calc.parameters.solvation_radii not in ["", "default"]:
+            if self.calc.parameters.solvation_radii not in _DEFAULT_RADII:
                 raise UnimplementedError(
                     """Only default solvation radii are supported for nwchem.
                                            For manual specification of other solvation radii, use custom solvation radii"""
@@ -416,7 +490,7 @@ class NWChemCalculation:
                         for element in self.solvation_radii
                     ]
                 )
-                self.additional_block += (
+                self.additional_block.append(
                     f"parameters {self.calc.name}_sol.parameters \n"
                 )
                 warn(
@@ -450,6 +524,10 @@ class NWChemCalculation:
             self.solvation_radii[_element] = _rad
 
     def close_blocks(self):
+        self.method_block = "".join(self.method_block)
+        self.calculation_block = "".join(self.calculation_block)
+        self.additional_block = "".join(self.additional_block)
+        self.tasks = "".join(self.tasks)
         if self.calc.parameters.theory_level == "mp2" and self.method_block == "mp2\n":
             self.method_block = ""
         if (
@@ -462,13 +540,14 @@ class NWChemCalculation:
         if "end \n" not in self.calculation_block and self.calculation_block != "":
             self.calculation_block += " end \n"
         if (
-            "end \n" not in self.additional_block
+            not self._addl_closed
+            and "end \n" not in self.additional_block
             and self.clean(self.additional_block) != ""
         ):
             self.additional_block += "end \n"
 
     def create_input_file(self):
-        raw = self.TEMPLATE.format(
+        raw = _render(
             self.calc.header,
             self.calc.name,
             self.calc.mem,
@@ -2163,6 +2163,194 @@ class NwchemTests(InputTests):
 
         self.assertTrue(self.is_equivalent(REF, inp.input_file))
 
+    def test_multiple_ecp_shared_keyword(self):
+        params = {
+            "nproc": 8,
+            "mem": "10000MB",
+            "type": "Geometrical Optimisation",
+            "file": "AgI.xyz",
+            "software": "nwchem",
+            "charge": "0",
+            "method": "B3LYP",
+            "basis_set": "6-31+G(d,p)",
+            "custom_basis_sets": "Ag=Def2-TZVPD;I=Def2-TZVPD;",
+        }
+
+        inp = self.generate_calculation(**params)
+
+        REF = """
+        TITLE "File created by ccinput"
+        start AgI
+        memory total 1250 mb
+        charge 0
+
+        geometry units angstroms noautosym
+        Ag  -9.27600000  -1.06330000   0.00000000
+        I   -6.60600000  -1.06330000   0.00000000
+        end
+
+        basis spherical
+        #BASIS SET: (7s,7p,6d,1f) -> [6s,4p,3d,1f]
+        Ag    S
+        19.000000000           -0.16600104141
+        15.428199933            0.35665095918
+        Ag    S
+        6.0553507268           1.0000000
+        Ag    S
+        1.4162368935           1.0000000
+        Ag    S
+        0.61758635858          1.0000000
+        Ag    S
+        0.10474197431          1.0000000
+        Ag    S
+        0.37685106264E-01      1.0000000
+        Ag    P
+        13.188180180            0.66928737147E-01
+        7.7952789138          -0.24735235409
+        2.0351571912           0.49154280216
+        0.98093914842          0.49741609006
+        Ag    P
+        0.44451179958          1.0000000
+        Ag    P
+        0.13000000000          1.0000000
+        Ag    P
+        0.41200000000E-01      1.0000000
+        Ag    D
+        25.784397351            0.35645063082E-02
+        11.396636755           -0.12984262784E-01
+        2.7345581361           0.24108826548
+        1.1873583605           0.42412330744
+        Ag    D
+        0.47316910566          1.0000000
+        Ag    D
+        0.16746017986          1.0000000
+        Ag    F
+        1.3971100              1.0000000
+
+        #BASIS SET: (12s,11p,9d,2f) -> [7s,6p,4d,2f]
+        I    S
+        5899.5791533              0.24188269271E-03
+        898.54238765             0.15474041742E-02
+        200.37237912             0.42836684457E-02
+        31.418053840           -0.39417936275E-01
+        15.645987838            0.96086691992
+        I    S
+        11.815741857            0.75961524091
+        6.4614458287           0.42495501835
+        I    S
+        2.3838067579           1.0000000
+        I    S
+        1.1712089662           1.0000000
+        I    S
+        0.32115875757          1.0000000
+        I    S
+        0.12387919364          1.0000000
+        I    S
+        0.43491550641E-01      1.0000000
+        I    P
+        197.30030547             0.73951226905E-03
+        20.061411349            0.66168450008E-01
+        9.7631460485          -0.28554662348
+        I    P
+        12.984316904           -0.49096186164E-01
+        3.6199503008           0.38914432482
+        2.0232273090           0.65610817262
+        1.0367490559           0.31803551647
+        I    P
+        0.45937816000          1.0000000
+        I    P
+        0.19116532928          1.0000000
+        I    P
+        0.74878813023E-01      1.0000000
+        I    P
+        0.21653491846E-01      1.0000000
+        I    D
+        119.12671745             0.82596039573E-03
+        33.404240134            0.68377675770E-02
+        17.805918203           -0.10308158997E-01
+        4.8990510353           0.22670457658
+        2.4516753106           0.44180113937
+        1.1820693432           0.36775472225
+        I    D
+        0.52923110068          1.0000000
+        I    D
+        0.17000000000          1.0000000
+        I    D
+        0.61341708807E-01      1.0000000
+        I    F
+        2.1800000              1.0000000
+        I    F
+        0.44141808             1.0000000
+
+        end
+
+        ecp
+        Ag nelec 28
+        Ag ul
+        2      14.2200000            -33.68992012
+        2       7.1100000             -5.53112021
+        Ag S
+        2      13.1300000            255.13936452
+        2       6.5100000             36.86612154
+        2      14.2200000             33.68992012
+        2       7.1100000              5.53112021
+        Ag P
+        2      11.7400000            182.18186871
+        2       6.2000000             30.35775148
+        2      14.2200000             33.68992012
+        2       7.1100000              5.53112021
+        Ag D
+        2      10.2100000             73.71926087
+        2       4.3800000             12.50211712
+        2      14.2200000             33.68992012
+        2       7.1100000              5.53112021
+
+        I nelec 28
+        I ul
+        2      19.45860900           -21.84204000
+        2      19.34926000           -28.46819100
+        2       4.82376700            -0.24371300
+        2       4.88431500            -0.32080400
+        I S
+        2      40.01583500            49.99429300
+        2      17.42974700           281.02531700
+        2       9.00548400            61.57332600
+        2      19.45860900            21.84204000
+        2      19.34926000            28.46819100
+        2       4.82376700             0.24371300
+        2       4.88431500             0.32080400
+        I P
+        2      15.35546600            67.44284100
+        2      14.97183300           134.88113700
+        2       8.96016400            14.67505100
+        2       8.25909600            29.37566600
+        2      19.45860900            21.84204000
+        2      19.34926000            28.46819100
+        2       4.82376700             0.24371300
+        2       4.88431500             0.32080400
+        I D
+        2      15.06890800            35.43952900
+        2      14.55532200            53.17605700
+        2       6.71864700             9.06719500
+        2       6.45639300            13.20693700
+        2       1.19177900             0.08933500
+        2       1.29115700             0.05238000
+        2      19.45860900            21.84204000
+        2      19.34926000            28.46819100
+        2       4.82376700             0.24371300
+        2       4.88431500             0.32080400
+        end
+
+        dft
+        xc b3lyp
+        mult 1
+        end
+
+        task dft optimize
+        """
+
+        self.assertTrue(self.is_equivalent(REF, inp.input_file))
+
     def test_builtin_custom_bs(self):
         params = {
             "nproc": 8,